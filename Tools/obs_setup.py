@@ -15,6 +15,7 @@ from astropy.coordinates import SkyCoord
 import astropy.units as u
 from astropy.time import Time
 import copy
+from functools import cached_property
 
 from ClusterPipe.Tools import background as model_bkg
 
@@ -34,7 +35,8 @@ class ObsSetup(object):
 
     Attributes
     ----------  
-    - obsid (str): the unique observation ID
+    - obsid (str): the unique observation ID, modified through add_obs 
+    and delete_obs or by assigning a new list, not in place
     - name (str): the label of the given observation run
     - coord (skycoord object): coordinates of the pointing
     - rad (quantity deg): radius of the pointing
@@ -86,6 +88,49 @@ class ObsSetup(object):
         self.bkg   = []
         
         
+    #==================================================
+    # Observation ID and their set
+    #==================================================
+
+    @property
+    def obsid(self):
+        """
+        List of the observation ID. Assigning a new list resets the 
+        cached set. The list should not be modified in place outside 
+        of add_obs and delete_obs.
+        
+        """
+        
+        return self._obsid
+
+    @obsid.setter
+    def obsid(self, value):
+        self._obsid = value
+        self.__dict__.pop('_obsid_set', None)
+
+    @cached_property
+    def _obsid_set(self):
+        """
+        Set of the observation ID, for fast membership test.
+        It is cached and must be reset when obsid changes.
+        
+        """
+        
+        return frozenset(self.obsid)
+
+    def __setstate__(self, state):
+        """
+        Restore a pickled object, including those saved when obsid 
+        was a plain attribute.
+        
+        """
+        
+        if 'obsid' in state:
+            state['_obsid'] = state.pop('obsid')
+        state.pop('_obsid_set', None)
+        self.__dict__.update(state)
+        
+        
     #==================================================
     # Remove an observation run
     #==================================================
@@ -122,6 +167,7 @@ class ObsSetup(object):
             del self.caldb[idx]
             del self.irf[idx]
             del self.bkg[idx]
+            self.__dict__.pop('_obsid_set', None)
             
             
     #==================================================
@@ -189,6 +235,7 @@ class ObsSetup(object):
             self.caldb.append(caldb)
             self.irf.append(irf)
             self.bkg.append(background)
+            self.__dict__.pop('_obsid_set', None)
             
 
     #==================================================
@@ -9,7 +9,9 @@ with Ana and Sim modules.
 #==================================================
 
 import os
+import functools
 import matplotlib
+import matplotlib.collections
 import matplotlib.pyplot as plt
 import matplotlib.pylab as pl
 from matplotlib.gridspec import GridSpec
@@ -20,6 +22,7 @@ from astropy.wcs import WCS
 import numpy as np
 from scipy import interpolate
 import scipy.ndimage as ndimage
+from scipy.signal import fftconvolve
 import random
 
 from ClusterPipe.Tools import plotting_irf
@@ -147,6 +150,40 @@ def correlation_from_covariance(covariance):
 # Get the CTA PSF given the IRF
 #==================================================
 
+@functools.lru_cache(maxsize=32)
+def _load_psf_table(caldb, irf):
+    """
+    Read the PSF table of a given IRF, cached so that the FITS
+    file is only parsed once per (caldb, irf).
+
+    Parameters
+    ----------
+    - caldb (str): the calibration database
+    - irf (str): input response function
+
+    Outputs
+    --------
+    - theta_mean (1d array): off-axis angle bin centers (deg)
+    - eng_mean (1d array): energy bin centers (TeV)
+    - PSF_E (1d array): on axis PSF sigma (deg) versus energy
+    """
+
+    CTOOLS_dir = os.getenv('CTOOLS')
+
+    data_file = CTOOLS_dir+'/share/caldb/data/cta/'+caldb+'/bcf/'+irf+'/irf_file.fits'
+    with fits.open(data_file, memmap=False) as hdul:
+        data_PSF = hdul[2].data
+        theta_mean = (data_PSF['THETA_LO'][0,:]+data_PSF['THETA_HI'][0,:])/2.0
+        eng_mean = (data_PSF['ENERG_LO'][0,:]+data_PSF['ENERG_HI'][0,:])/2.0
+        PSF_E = data_PSF['SIGMA_1'][0,0,:] # This is on axis
+
+    theta_mean = np.ascontiguousarray(theta_mean, dtype=np.float64)
+    eng_mean   = np.ascontiguousarray(eng_mean, dtype=np.float64)
+    PSF_E      = np.ascontiguousarray(PSF_E, dtype=np.float64)
+
+    return theta_mean, eng_mean, PSF_E
+
+
 def get_cta_psf(caldb, irf, emin, emax, w8_slope=-2):
     """
     Return the on-axis maximum PSF between emin and emax.
@@ -165,26 +202,17 @@ def get_cta_psf(caldb, irf, emin, emax, w8_slope=-2):
     - PSF (FWHM, deg): on axis point spread function
     """
 
-    CTOOLS_dir = os.getenv('CTOOLS')
-
-    data_file = CTOOLS_dir+'/share/caldb/data/cta/'+caldb+'/bcf/'+irf+'/irf_file.fits'
-    hdul = fits.open(data_file)
-    data_PSF = hdul[2].data
-    hdul.close()
+    theta_mean, eng_mean, PSF_E = _load_psf_table(caldb, irf)
 
-    theta_mean = (data_PSF['THETA_LO'][0,:]+data_PSF['THETA_HI'][0,:])/2.0
-    eng_mean = (data_PSF['ENERG_LO'][0,:]+data_PSF['ENERG_HI'][0,:])/2.0
-    PSF_E = data_PSF['SIGMA_1'][0,0,:] # This is on axis
-    
-    fitpl  = interpolate.interp1d(eng_mean, PSF_E, kind='cubic')
-    e_itpl = np.logspace(np.log10(emin), np.log10(emax), 1000)
+    fitpl  = interpolate.CubicSpline(eng_mean, PSF_E, extrapolate=False)
+    e_itpl = np.logspace(np.log10(emin), np.log10(emax), 1000) # Already within [emin, emax]
     PSF_itpl = fitpl(e_itpl)
-    PSF_itpl = PSF_itpl * 2*np.sqrt(2*np.log(2)) # Convert to FWHM
-                     
-    weng = (e_itpl > emin) * (e_itpl < emax)
+    if np.any(np.isnan(PSF_itpl)):
+        raise ValueError("The energy range is outside the range covered by the IRF.")
+
+    w8  = e_itpl**w8_slope
+    PSF = np.dot(PSF_itpl, w8) / np.sum(w8) * 2*np.sqrt(2*np.log(2)) # Convert to FWHM
 
-    PSF = np.sum(PSF_itpl[weng] * e_itpl[weng]**w8_slope) / np.sum(e_itpl[weng]**w8_slope)
-    
     return PSF
 
 
@@ -192,9 +220,53 @@ def get_cta_psf(caldb, irf, emin, emax, w8_slope=-2):
 #Show the IRF
 #==================================================
 
+@functools.lru_cache(maxsize=16)
+def _get_irf(caldb, irf):
+    """
+    Build the gammalib response function, cached so that the IRF 
+    is only parsed once per (caldb, irf).
+
+    Parameters
+    ----------
+    - caldb (str): the calibration database
+    - irf (str): input response function
+
+    Outputs
+    --------
+    - irf (GCTAResponseIrf): the response function
+    """
+
+    return gammalib.GCTAResponseIrf(irf, gammalib.GCaldb('cta', caldb))
+
+
+def _fmt_range(vmin, vmax, unit, fmt_min, fmt_max):
+    """
+    Format a selection range as 'min-max unit', '>min unit' or '<max unit'.
+
+    Parameters
+    ----------
+    - vmin, vmax (float): range bounds, None if not bounded
+    - unit (str): unit to append
+    - fmt_min, fmt_max (str): format of the bounds
+
+    Outputs
+    --------
+    - selection (str): the range string, empty if not bounded
+    """
+
+    if vmin is not None and vmax is not None:
+        return (fmt_min+'-'+fmt_max+' %s') % (vmin, vmax, unit)
+    if vmin is not None:
+        return ('>'+fmt_min+' %s') % (vmin, unit)
+    if vmax is not None:
+        return ('<'+fmt_max+' %s') % (vmax, unit)
+    return ''
+
+
 def show_irf(caldb_in, irf_in, plotfile,
              emin=None, emax=None,
-             tmin=None, tmax=None):
+             tmin=None, tmax=None,
+             figsize=(16, 9), dpi=100):
     """
     Show the IRF by calling the ctools function
 
@@ -206,6 +278,8 @@ def show_irf(caldb_in, irf_in, plotfile,
     - emax (max energy): maximal energy in TeV
     - tmin (min energy): minimal angle in deg
     - tmax (max energy): maximal angle in deg
+    - figsize (float tuple): figure size in inches
+    - dpi (int): resolution of the figure
 
     """
 
@@ -221,35 +295,19 @@ def show_irf(caldb_in, irf_in, plotfile,
             caldb_use.append(caldb_in[i])
             irf_use.append(irf_in[i])
 
+    # Build selection string
+    parts = [part for part in (_fmt_range(emin, emax, 'TeV', '%.3f', '%.1f'),
+                               _fmt_range(tmin, tmax, 'deg', '%.1f', '%.1f')) if part]
+    selection = ' (%s)' % ', '.join(parts) if parts else ''
+
+    # Create the figure once, cleared for each IRF
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+
     # ----- Loop over all caldb+irf used
     for i in range(len(caldb_use)):
            
         # Convert to gammalib format
-        caldb = gammalib.GCaldb('cta', caldb_use[i])
-        irf   = gammalib.GCTAResponseIrf(irf_use[i], caldb)
-
-        # Build selection string
-        selection  = ''
-        eselection = ''
-        tselection = ''
-        if emin != None and emax != None:
-            eselection += '%.3f-%.1f TeV' % (emin, emax)
-        elif emin != None:
-            eselection += ' >%.3f TeV' % (emin)
-        elif emax != None:
-            eselection += ' <%.1f TeV' % (emax)
-        if tmin != None and tmax != None:
-            tselection += '%.1f-%.1f deg' % (tmin, tmax)
-        elif tmin != None:
-            tselection += ' >%.1f deg' % (tmin)
-        elif tmax != None:
-            tselection += ' <%.1f deg' % (tmax)
-        if len(eselection) > 0 and len(tselection) > 0:
-            selection = ' (%s, %s)' % (eselection, tselection)
-        elif len(eselection) > 0:
-            selection = ' (%s)' % (eselection)
-        elif len(tselection) > 0:
-            selection = ' (%s)' % (tselection)
+        irf = _get_irf(caldb_use[i], irf_use[i])
 
         # Build title
         mission    = irf.caldb().mission()
@@ -258,8 +316,8 @@ def show_irf(caldb_in, irf_in, plotfile,
         title      = '%s "%s" Instrument Response Function "%s"%s' % \
             (gammalib.toupper(mission), instrument, response, selection)
 
-        # Create figure
-        fig = plt.figure(figsize=(22,12))
+        # Reset figure
+        fig.clf()
         
         # Add title
         fig.suptitle(title, fontsize=16)
@@ -281,12 +339,39 @@ def show_irf(caldb_in, irf_in, plotfile,
         plotting_irf.plot_edisp(irf.edisp(), emin=emin, emax=emax, tmin=tmin, tmax=tmax)
         
         # Show plots or save it into file
-        plt.savefig(plotfile+'_'+list_use[i]+'.pdf')
-        plt.close()
+        fig.savefig(plotfile+'_'+list_use[i]+'.pdf', dpi=dpi)
+
+    plt.close(fig)
 
     return
 
 
+#==================================================
+# Gaussian kernel
+#==================================================
+
+def _gauss1d(sigma, truncate=4.0):
+    """
+    Normalized 1D gaussian kernel, truncated at truncate*sigma
+    as in ndimage.gaussian_filter.
+
+    Parameters
+    ----------
+    - sigma (float): the gaussian standard deviation in pixels
+    - truncate (float): kernel half size in units of sigma
+
+    Outputs
+    --------
+    - kernel (1d array): the kernel
+    """
+
+    radius = int(truncate*sigma + 0.5)
+    x = np.arange(-radius, radius+1)
+    kernel = np.exp(-0.5*(x/sigma)**2)
+
+    return kernel / np.sum(kernel)
+
+
 #==================================================
 # Show map
 #==================================================
@@ -308,7 +393,10 @@ def show_map(mapfile, outfile,
              rangevalue=[None, None],
              logscale=True,
              significance=False,
-             cmap='magma'):
+             cmap='magma',
+             downscale=1,
+             figsize=(8, 8),
+             dpi=100):
     """
     Plot maps to show.
 
@@ -333,6 +421,12 @@ def show_map(mapfile, outfile,
     - logscale (bool): apply log color bar
     - significance (bool): is this a significance map?
     - cmap (str): colormap
+    - downscale (int): bin the map by downscale x downscale pixels 
+    before smoothing, e.g. for quick previews. For significance maps, 
+    the mean over the bins reduces the noise by downscale, which is 
+    accounted for in the smoothing boost
+    - figsize (float tuple): figure size in inches
+    - dpi (int): resolution of the figure
 
     Outputs
     --------
@@ -342,9 +436,20 @@ def show_map(mapfile, outfile,
     set_default_plot_param()
 
     #---------- Read the data
-    data = fits.open(mapfile)[0]
-    image = data.data
-    wcs_map = WCS(data.header)
+    with fits.open(mapfile, memmap=True, mode='readonly') as hdul:
+        image = np.array(hdul[0].data, copy=True)
+        header = hdul[0].header.copy()
+    wcs_map = WCS(header)
+
+    #---------- Binning
+    if downscale > 1:
+        Ny = image.shape[0]//downscale
+        Nx = image.shape[1]//downscale
+        image = image[0:Ny*downscale, 0:Nx*downscale]
+        image = image.reshape(Ny, downscale, Nx, downscale).mean(axis=(1,3))
+        wcs_map = wcs_map.slice((slice(0, Ny*downscale, downscale),
+                                 slice(0, Nx*downscale, downscale)))
+    
     reso = abs(wcs_map.wcs.cdelt[0])
     Npixx = image.shape[0]
     Npixy = image.shape[1]
@@ -353,10 +458,20 @@ def show_map(mapfile, outfile,
             
     #---------- Smoothing
     sigma_sm = (smoothing_FWHM/(2*np.sqrt(2*np.log(2)))).to_value('deg')/reso
-    image = ndimage.gaussian_filter(image, sigma=sigma_sm)
+    image = image.astype(np.float32) # Display only, no need for double precision
+    if sigma_sm > 4 and np.isfinite(image).all(): # Separable FFT convolution is faster for large kernels
+        kernel = _gauss1d(sigma_sm).astype(np.float32)
+        r = len(kernel)//2
+        image = np.pad(image, r, mode='symmetric') # Same edges as the gaussian_filter 'reflect' mode
+        image = fftconvolve(image, kernel[:,None], mode='same')
+        image = fftconvolve(image, kernel[None,:], mode='same')
+        image = image[r:-r, r:-r]
+    else:
+        image = ndimage.gaussian_filter(image, sigma=sigma_sm)
 
     if significance:
         norm = 2*sigma_sm*np.sqrt(np.pi) # Mean noise smoothing reduction, assuming gaussian correlated noise
+        norm *= downscale                # Noise reduction from the mean over downscale x downscale pixels
         image *= norm
         print('WARNING: The significance is boosted accounting for smoothing.')
         print('         This assumes weak noise spatial variarion (w.r.t. smoothing),')
@@ -375,7 +490,7 @@ def show_map(mapfile, outfile,
         
     #---------- Plot
     if not ((np.amax(image) == 0) and (np.amin(image) == 0)) :
-        fig = plt.figure(1, figsize=(12, 9))
+        fig = plt.figure(1, figsize=figsize, dpi=dpi)
         ax = plt.subplot(111, projection=wcs_map)
 
         if logscale :
@@ -393,7 +508,7 @@ def show_map(mapfile, outfile,
                                                     edgecolor='lightgray', linestyle='dashed',
                                                     facecolor='none',
                                                     transform=ax.get_transform('fk5'),
-                                                    label='$R_{500}$')
+                                                    label='$R_{500}$', rasterized=True)
             ax.add_patch(circle_500)
             txt_r500 = plt.text(cluster_ra - cluster_t500, cluster_dec - cluster_t500,
                                 '$R_{500}$',
@@ -405,7 +520,7 @@ def show_map(mapfile, outfile,
         if (ptg_ra is not None) * (ptg_dec is not None) :
             ax.scatter(ptg_ra, ptg_dec,
                        transform=ax.get_transform('icrs'), color='gray', marker='+', s=100,
-                       label='Pointings')
+                       label='Pointings', rasterized=True)
 
             try:
                 txt_ptg = plt.text(ptg_ra, ptg_dec+0.2, 'Pointing',
@@ -423,7 +538,7 @@ def show_map(mapfile, outfile,
         if (cluster_ra is not None) * (cluster_dec is not None) :
             ax.scatter(cluster_ra, cluster_dec,
                        transform=ax.get_transform('icrs'), color='cyan', marker='x', s=100,
-                       label=cluster_name+' center')
+                       label=cluster_name+' center', rasterized=True)
             txt_clust = plt.text(cluster_ra, cluster_dec-0.2, cluster_name,
                              transform=ax.get_transform('fk5'), fontsize=10,
                              color='cyan', horizontalalignment='center',
@@ -434,24 +549,28 @@ def show_map(mapfile, outfile,
             if (ps_ra[i] is not None) * (ps_dec[i] is not None) :
                 ax.scatter(ps_ra[i], ps_dec[i],
                            transform=ax.get_transform('icrs'), s=200, marker='o',
-                           facecolors='none', edgecolors='green', label='Point sources')
+                           facecolors='none', edgecolors='green', label='Point sources',
+                           rasterized=True)
                 txt_ps = plt.text(ps_ra[i]-0.1, ps_dec[i]+0.1, ps_name[i],
                                   transform=ax.get_transform('fk5'),fontsize=10, color='green')
                 
         # Show the PSF
         if PSF is not None:
-            dec_mean_cor = np.cos((wcs_map.wcs.crval[1]-(wcs_map.wcs.crpix*wcs_map.wcs.cdelt)[1]+0.3)
-                                  * np.pi/180.0)
-            circle_ra = wcs_map.wcs.crval[0]-(wcs_map.wcs.crpix*wcs_map.wcs.cdelt)[0]/dec_mean_cor-0.3
-            circle_dec = wcs_map.wcs.crval[1]-(wcs_map.wcs.crpix*wcs_map.wcs.cdelt)[1]+0.3
+            crpix_deg = wcs_map.wcs.crpix*wcs_map.wcs.cdelt
+            base_dec = wcs_map.wcs.crval[1] - crpix_deg[1] + 0.3
+            dec_mean_cor = np.cos(base_dec * np.pi/180.0)
+            base_ra = wcs_map.wcs.crval[0] - crpix_deg[0]/dec_mean_cor
+            circle_ra = base_ra - 0.3
+            circle_dec = base_dec
             circle_PSF = matplotlib.patches.Ellipse((circle_ra, circle_dec),
                                                     PSF/dec_mean_cor, PSF,
                                                     angle=0, linewidth=1, fill=True,
                                                     zorder=2, facecolor='lightgray',
                                                     edgecolor='white',
-                                                    transform=ax.get_transform('fk5'))
-            txt_ra  = wcs_map.wcs.crval[0]-(wcs_map.wcs.crpix*wcs_map.wcs.cdelt)[0]/dec_mean_cor-0.6
-            txt_dec = wcs_map.wcs.crval[1]-(wcs_map.wcs.crpix*wcs_map.wcs.cdelt)[1]+0.3
+                                                    transform=ax.get_transform('fk5'),
+                                                    rasterized=True)
+            txt_ra  = base_ra - 0.6
+            txt_dec = base_dec
             txt_psf = plt.text(txt_ra, txt_dec, 'PSF',
                                transform=ax.get_transform('fk5'), fontsize=12,
                                color='white',  verticalalignment='center')
@@ -464,7 +583,7 @@ def show_map(mapfile, outfile,
         cbar = plt.colorbar()
         cbar.set_label(bartitle)
         #plt.legend(framealpha=1)
-        fig.savefig(outfile)
+        fig.savefig(outfile, dpi=dpi, bbox_inches='tight')
         plt.close()
 
     else :
@@ -497,10 +616,10 @@ def show_profile(proffile, outfile,
     set_default_plot_param()
 
     #---------- Read the data
-    data = fits.open(proffile)[1]
-    prof = data.data
-    r_unit = data.columns['radius'].unit
-    p_unit = data.columns['profile'].unit
+    with fits.open(proffile, memmap=True, mode='readonly') as hdul:
+        prof = hdul[1].data.copy()
+        r_unit = hdul[1].columns['radius'].unit
+        p_unit = hdul[1].columns['profile'].unit
 
     # Get the unit and adapt deg,arcmin,arcsec
     r_str_label = u.Unit(r_unit).to_string(format='latex_inline')
@@ -514,14 +633,18 @@ def show_profile(proffile, outfile,
 
     # Check if expected file is there
     if expected_file is not None:
-        exp = fits.open(expected_file)[1]
-        prof_exp = exp.data
+        with fits.open(expected_file, memmap=True, mode='readonly') as hdul:
+            prof_exp = hdul[1].data.copy()
         wnan_exp = np.isnan(prof_exp['profile']) * (prof_exp['radius'] > 0.5) # NaN at r>0.5 deg should be model=0
         prof_exp['profile'][wnan_exp] = 0.0 
         
     #---------- Plot
-    w_pos = prof['profile'] >= 0
-    w_neg = prof['profile'] < 0
+    radius  = prof['radius']
+    profile = prof['profile']
+    error   = prof['error']
+    w_pos = profile >= 0
+    w_neg = ~w_pos # NaN values fall here but are not drawn
+    profile_pos = profile[w_pos]
     
     fig = plt.figure(1, figsize=(12, 8))
 
@@ -532,19 +655,19 @@ def show_profile(proffile, outfile,
         frame1 = fig.add_axes((.1,.1,.8,.8))
 
     if logscale:
-        plt.errorbar(prof['radius'][w_pos], prof['profile'][w_pos], yerr=prof['error'][w_pos],
+        plt.errorbar(radius[w_pos], profile_pos, yerr=error[w_pos],
                      color='blue', marker='o', linestyle='', label='data (> 0)')
-        plt.errorbar(prof['radius'][w_neg], -prof['profile'][w_neg], yerr=prof['error'][w_neg],
+        plt.errorbar(radius[w_neg], -profile[w_neg], yerr=error[w_neg],
                      color='cyan', marker='D', linestyle='', label='data (< 0)')
-        xlim = [np.nanmin(prof['radius'])*0.5,         np.nanmax(prof['radius'])*1.1]
-        ylim = [np.nanmin(prof['profile'][w_pos])*0.5, np.nanmax(prof['profile']+prof['error'])*1.5]
+        xlim = [np.nanmin(radius)*0.5,      np.nanmax(radius)*1.1]
+        ylim = [np.nanmin(profile_pos)*0.5, np.nanmax(profile+error)*1.5]
         plt.xscale('log')
         plt.yscale('log')
     else:
-        plt.errorbar(prof['radius'], prof['profile'], yerr=prof['error'],
+        plt.errorbar(radius, profile, yerr=error,
                      color='blue', marker='o', linestyle='', label='data')
-        xlim = [0, np.nanmax(prof['radius'])*1.1]
-        ylim = [np.nanmin(prof['profile'][w_pos]), np.nanmax(prof['profile']+prof['error'])]
+        xlim = [0, np.nanmax(radius)*1.1]
+        ylim = [np.nanmin(profile_pos), np.nanmax(profile+error)]
         plt.xscale('linear')
         plt.yscale('linear')
         
@@ -574,9 +697,9 @@ def show_profile(proffile, outfile,
         frame2 = fig.add_axes((.1,.1,.8,.2))
 
         itpl = interpolate.interp1d(prof_exp['radius'], prof_exp['profile'])
-        prof_exp_itpl = itpl(prof['radius'])
+        prof_exp_itpl = itpl(radius)
         
-        plt.plot(prof['radius'], (prof['profile']-prof_exp_itpl)/prof['error'],
+        plt.plot(radius, (profile-prof_exp_itpl)/error,
                  color='k', marker='o', linestyle='')
         plt.hlines(0,  xlim[0], xlim[1], linestyle='-')
         plt.hlines(-3, xlim[0], xlim[1], linestyle='--')
@@ -600,6 +723,34 @@ def show_profile(proffile, outfile,
     plt.close()
 
     
+#==================================================
+# Median by selection
+#==================================================
+
+def _fast_median(array):
+    """
+    Median of an array using a partial sort (O(N)) rather 
+    than the full sort of np.median.
+
+    Parameters
+    ----------
+    - array (array): input values
+
+    Outputs
+    --------
+    - median (float): the median value
+    """
+
+    array = np.ravel(array)
+    n = array.size
+    k = n//2
+    if n % 2:
+        return np.partition(array, k)[k]
+    part = np.partition(array, [k-1, k])
+    
+    return 0.5*(part[k-1] + part[k])
+
+    
 #==================================================
 # Quicklook of the event
 #==================================================
@@ -620,32 +771,27 @@ def events_quicklook(evfile, outfile):
 
     set_default_plot_param()
     
-    events_hdu = fits.open(evfile)
-
     try:
-        events_data1 = events_hdu[1].data
-        events_data2 = events_hdu[2].data
-        
-        events_hdr0 = fits.getheader(evfile, 0)  # get default HDU (=0), i.e. primary HDU's header
-        events_hdr1 = fits.getheader(evfile, 1)  # get primary HDU's header
-        events_hdr2 = fits.getheader(evfile, 2)  # the second extension
-        
-        events_hdu.close()
+        # Keep only the plotted columns, the file is released afterwards
+        Npt_plot = 1e5
+        with fits.open(evfile, memmap=True, mode='readonly') as events_hdu:
+            events_data1 = events_hdu[1].data
+            events_hdr1  = events_hdu[1].header.copy()
+            Nevents      = len(events_data1)
+            step         = max(1, Nevents//int(Npt_plot))
+            ra_reduce    = np.array(events_data1['RA'][::step])
+            dec_reduce   = np.array(events_data1['DEC'][::step])
+            energy       = np.array(events_data1['ENERGY'])
+            time         = np.array(events_data1['TIME'])
+            del events_data1
 
         fig = plt.figure(1, figsize=(18, 14))
         
         # Plot the photon counts in RA-Dec
-        Npt_plot = 1e5
-        if len(events_data1) > Npt_plot:
-            w = np.random.uniform(0,1,size=len(events_data1)) < Npt_plot/len(events_data1)
-            events_data1_reduce = events_data1[w]
-        else :
-            events_data1_reduce = events_data1
-        
         plt.subplot(221)
-        plt.plot(events_data1_reduce['RA'], events_data1_reduce['DEC'], 'ko', ms=0.4, alpha=0.2)
-        plt.xlim(np.amax(events_data1_reduce['RA']), np.amin(events_data1_reduce['RA']))
-        plt.ylim(np.amin(events_data1_reduce['DEC']), np.amax(events_data1_reduce['DEC']))
+        plt.plot(ra_reduce, dec_reduce, 'ko', ms=0.4, alpha=0.2)
+        plt.xlim(ra_reduce.max(), ra_reduce.min())
+        plt.ylim(dec_reduce.min(), dec_reduce.max())
         plt.xlabel('RA (deg)')
         plt.ylabel('Dec (deg)')
         plt.title('Photon coordinate map')
@@ -653,14 +799,19 @@ def events_quicklook(evfile, outfile):
         
         # Energy histogram
         plt.subplot(222)
-        plt.hist(np.log10(events_data1['ENERGY']), bins=50, color='black', log=True, alpha=0.3)
-        plt.xlabel('log E/TeV')
+        if energy.min() < energy.max():
+            ebins = np.logspace(np.log10(energy.min()), np.log10(energy.max()), 51)
+        else:
+            ebins = 50 # Single energy, log bins would be empty
+        plt.hist(energy, bins=ebins, color='black', log=True, alpha=0.3)
+        plt.xscale('log')
+        plt.xlabel('E/TeV')
         plt.ylabel('Photon counts')
         plt.title('Photon energy histogram')
         
         # Time counts histogram
         plt.subplot(223)
-        plt.hist((events_data1['TIME'] - np.amin(events_data1['TIME']))/3600.0, bins=200,
+        plt.hist((time - np.amin(time))/3600.0, bins=200,
                  log=False, color='black', alpha=0.3)
         plt.xlabel('Time (h)')
         plt.ylabel('Photon counts')
@@ -672,9 +823,9 @@ def events_quicklook(evfile, outfile):
         i2 = 'Date obs: '+events_hdr1['DATE-OBS']+'-'+events_hdr1['TIME-OBS']
         i3 = 'Date end: '+events_hdr1['DATE-END']+'-'+events_hdr1['TIME-END']
         i4 = 'Live time: '+str(events_hdr1['LIVETIME'])+' '+events_hdr1['TIMEUNIT']
-        t1 = 'Number of events: \n..... '+str(len(events_data1))
-        t2 = 'Median energy: \n..... '+str(np.median(events_data1['ENERGY']))+events_hdr1['EUNIT']
-        t3 = 'Median R.A.,Dec.: \n..... '+str(np.median(events_data1_reduce['RA']))+' deg \n..... '+str(np.median(events_data1_reduce['DEC']))+' deg'
+        t1 = 'Number of events: \n..... '+str(Nevents)
+        t2 = 'Median energy: \n..... '+str(_fast_median(energy))+events_hdr1['EUNIT']
+        t3 = 'Median R.A.,Dec.: \n..... '+str(_fast_median(ra_reduce))+' deg \n..... '+str(_fast_median(dec_reduce))+' deg'
         plt.text(0.1, 0.85, i1, ha='left', rotation=0, wrap=True)
         plt.text(0.1, 0.80, i2, ha='left', rotation=0, wrap=True)
         plt.text(0.1, 0.75, i3, ha='left', rotation=0, wrap=True)
@@ -697,7 +848,7 @@ def events_quicklook(evfile, outfile):
 # Get the pointing patern from a file
 #==================================================
 
-def get_pointings(filename):
+def get_pointings(filename, galactic=True):
     """
     Extract pointings from XML file
 
@@ -705,6 +856,8 @@ def get_pointings(filename):
     ----------
     filename : str
         File name of observation definition XML file
+    galactic : bool
+        Also compute the galactic coordinates 'l' and 'b'
 
     Returns
     -------
@@ -729,8 +882,14 @@ def get_pointings(filename):
         # Get observation
         run = obs.element('observation', i)
 
+        # Get parameters by name in a single pass
+        npars  = run.elements('parameter')
+        params = {}
+        for k in range(npars):
+            par = run.element('parameter', k)
+            params[par.attribute('name')] = par
+
         # Get pointing parameter
-        npars   = run.elements('parameter')
         ra      = None
         dec     = None
         roi_ra  = None
@@ -738,26 +897,29 @@ def get_pointings(filename):
         roi_rad = None
         evfile  = None
         obsid   = run.attribute('id')
-        for k in range(npars):
-            par = run.element('parameter', k)
-            if par.attribute('name') == 'Pointing':
-                ra  = float(par.attribute('ra'))
-                dec = float(par.attribute('dec'))
-            elif par.attribute('name') == 'RegionOfInterest':
-                roi_ra  = float(par.attribute('ra'))
-                roi_dec = float(par.attribute('dec'))
-                roi_rad = float(par.attribute('rad'))
-            elif par.attribute('name') == 'EventList':
-                evfile = par.attribute('file')
+        par = params.get('Pointing')
+        if par is not None:
+            ra  = float(par.attribute('ra'))
+            dec = float(par.attribute('dec'))
+        par = params.get('RegionOfInterest')
+        if par is not None:
+            roi_ra  = float(par.attribute('ra'))
+            roi_dec = float(par.attribute('dec'))
+            roi_rad = float(par.attribute('rad'))
+        par = params.get('EventList')
+        if par is not None:
+            evfile = par.attribute('file')
 
         # Add valid pointing
-        if ra != None:
-            p   = gammalib.GSkyDir()
-            p.radec_deg(ra, dec)
-            entry = {'l': p.l_deg(), 'b': p.b_deg(),
-                     'ra': ra, 'dec': dec,
+        if ra is not None:
+            entry = {'ra': ra, 'dec': dec,
                      'roi_ra': roi_ra, 'roi_dec': roi_dec, 'roi_rad': roi_rad,
                      'evfile': evfile, 'obsid':obsid}
+            if galactic:
+                p = gammalib.GSkyDir()
+                p.radec_deg(ra, dec)
+                entry['l'] = p.l_deg()
+                entry['b'] = p.b_deg()
             pnt.append(entry)
 
     return pnt
@@ -767,7 +929,7 @@ def get_pointings(filename):
 # Plot the pointings
 #==================================================
 
-def show_pointings(xml_file, plotfile):
+def show_pointings(xml_file, plotfile, figsize=None, dpi=100):
     """
     Plot information
 
@@ -775,67 +937,67 @@ def show_pointings(xml_file, plotfile):
     ----------
     - xml_file (str) : Observation definition xml file
     - plotfile (str): Plot filename
+    - figsize (float tuple): figure size in inches. By default 
+    8x8, growing as sqrt(N) above 50 pointings
+    - dpi (int): resolution of the figure
     """
 
     set_default_plot_param()
 
-    pnt = get_pointings(xml_file)
+    pnt = get_pointings(xml_file, galactic=False)
     
     # Create figure
-    plt.figure()
-    fig = plt.figure(1, figsize=(10, 10))
+    if figsize is None:
+        side = 8*max(1.0, np.sqrt(len(pnt)/50.0))
+        figsize = (side, side)
+    fig = plt.figure(1, figsize=figsize, dpi=dpi)
     ax  = plt.subplot(111)
     colors = pl.cm.jet(np.linspace(0,1,len(pnt)))
 
-    # Loop over pointings
-    xmin = []
-    xmax = []
-    ymin = []
-    ymax = []
-    i = 0
-    for p in pnt:
-        ra  = p['ra']
-        dec = p['dec']
-        roi_ra  = p['roi_ra']
-        roi_dec = p['roi_dec']
-        roi_rad = p['roi_rad']
-        obsid   = p['obsid']
-
-        #color = "#"+''.join([random.choice('0123456789ABCDEF') for j in range(6)])
-        color = colors[i]
-        
-        ax.scatter(ra, dec, s=150, marker='x', color=color)
-        circle = matplotlib.patches.Ellipse(xy=(roi_ra, roi_dec),
-                                            width=2*roi_rad/np.cos(dec*np.pi/180),
-                                            height=2*roi_rad,
-                                            alpha=0.1,
-                                            linewidth=1,
-                                            #color=color,
-                                            facecolor=color,
-                                            edgecolor=color, label='ObsID'+obsid)
-        ax.add_patch(circle)
-        
-        xmin.append(roi_ra-roi_rad/np.cos(dec*np.pi/180))
-        xmax.append(roi_ra+roi_rad/np.cos(dec*np.pi/180))
-        ymin.append(roi_dec-roi_rad)
-        ymax.append(roi_dec+roi_rad)
-        i += 1
-
-    xctr = (np.amax(xmax) + np.amin(xmin)) / 2.0
-    yctr = (np.amax(ymax) + np.amin(ymin)) / 2.0
-    fovx = (np.amax(xmax) - np.amin(xmin))*1.1/np.cos(yctr*np.pi/180)
-    fovy = (np.amax(ymax) - np.amin(ymin))*1.1
+    # Gather the pointings as arrays
+    ra      = np.array([p['ra'] for p in pnt])
+    dec     = np.array([p['dec'] for p in pnt])
+    roi_ra  = np.array([p['roi_ra'] for p in pnt])
+    roi_dec = np.array([p['roi_dec'] for p in pnt])
+    roi_rad = np.array([p['roi_rad'] for p in pnt])
+    cosd    = np.cos(dec*np.pi/180)
+
+    # Pointings and ROI, drawn at once
+    ax.scatter(ra, dec, s=150, marker='x', color=colors, rasterized=True)
+    circles = matplotlib.collections.EllipseCollection(2*roi_rad/cosd, 2*roi_rad, np.zeros(len(pnt)),
+                                                       units='xy',
+                                                       offsets=np.c_[roi_ra, roi_dec],
+                                                       offset_transform=ax.transData,
+                                                       facecolors=colors, edgecolors=colors,
+                                                       linewidth=1, alpha=0.1, rasterized=True)
+    ax.add_collection(circles)
+
+    # Legend proxies, since collections carry a single label
+    handles = [matplotlib.patches.Patch(facecolor=colors[i], edgecolor=colors[i], alpha=0.1,
+                                        label='ObsID'+pnt[i]['obsid']) for i in range(len(pnt))]
+
+    # Bounds, one reduction each
+    roi_wid = roi_rad/cosd
+    xmin = (roi_ra - roi_wid).min()
+    xmax = (roi_ra + roi_wid).max()
+    ymin = (roi_dec - roi_rad).min()
+    ymax = (roi_dec + roi_rad).max()
+
+    xctr = (xmax + xmin) / 2.0
+    yctr = (ymax + ymin) / 2.0
+    fovx = (xmax - xmin)*1.1/np.cos(yctr*np.pi/180)
+    fovy = (ymax - ymin)*1.1
         
     plt.xlim(xctr+fovx/2, xctr-fovx/2)
     plt.ylim(yctr-fovy/2, yctr+fovy/2)
-    plt.legend()
+    plt.legend(handles=handles)
         
     # Plot title and labels
     plt.xlabel('R.A. (deg)')
     plt.ylabel('Dec. (deg)')
 
     # Show plots or save it into file
-    plt.savefig(plotfile)
+    plt.savefig(plotfile, dpi=dpi, bbox_inches='tight')
     plt.close()
 
     return
@@ -869,6 +1031,58 @@ def show_obsdef(xml_file, coord, plotfile):
     return
 
 
+#==================================================
+# Evaluate a spectral model
+#==================================================
+
+def _eval_spectrum(spectrum, energies, e_MeV):
+    """
+    Evaluate a gammalib spectral model on a list of energies.
+    Simple analytic forms are computed at once with numpy, other 
+    models are evaluated with gammalib energy by energy.
+
+    Parameters
+    ----------
+    - spectrum (GModelSpectral): the spectral model
+    - energies (GEnergy list): the energies
+    - e_MeV (1d array): the same energies in MeV
+
+    Outputs
+    --------
+    - dNdE (1d array): the spectrum in ph/s/cm2/MeV
+    """
+
+    # The type() string is shared by several parameterisations (e.g. 
+    # the PhotonFlux power law), so check the class and the parameters
+    cname = spectrum.classname()
+    pars  = {'GModelSpectralPlaw':        ['Prefactor', 'Index', 'PivotEnergy'],
+             'GModelSpectralExpPlaw':     ['Prefactor', 'Index', 'PivotEnergy', 'CutoffEnergy'],
+             'GModelSpectralLogParabola': ['Prefactor', 'Index', 'Curvature', 'PivotEnergy']}
+    analytic = cname in pars and all(spectrum.has_par(name) for name in pars[cname])
+    
+    if analytic and cname == 'GModelSpectralPlaw':
+        k0    = spectrum['Prefactor'].value()
+        index = spectrum['Index'].value()
+        pivot = spectrum['PivotEnergy'].value()
+        return k0 * (e_MeV/pivot)**index
+    
+    if analytic and cname == 'GModelSpectralExpPlaw':
+        k0     = spectrum['Prefactor'].value()
+        index  = spectrum['Index'].value()
+        pivot  = spectrum['PivotEnergy'].value()
+        cutoff = spectrum['CutoffEnergy'].value()
+        return k0 * (e_MeV/pivot)**index * np.exp(-e_MeV/cutoff)
+    
+    if analytic and cname == 'GModelSpectralLogParabola':
+        k0        = spectrum['Prefactor'].value()
+        index     = spectrum['Index'].value()
+        curvature = spectrum['Curvature'].value()
+        pivot     = spectrum['PivotEnergy'].value()
+        return k0 * (e_MeV/pivot)**(index + curvature*np.log(e_MeV/pivot))
+    
+    return np.fromiter((spectrum.eval(energy) for energy in energies), dtype=np.float64, count=len(energies))
+
+
 #==================================================
 # Plot the spectrum of the sources in a model
 #==================================================
@@ -894,6 +1108,9 @@ def show_model_spectrum(xml_file, plotfile,
     e_min   = gammalib.GEnergy(emin, 'TeV')
     e_max   = gammalib.GEnergy(emax, 'TeV')
     ebounds = gammalib.GEbounds(enumbins, e_min, e_max)
+    energies = [ebounds.elogmean(i) for i in range(enumbins)]
+    x = np.array([energy.TeV() for energy in energies])
+    x_MeV = x*1e6
 
     # Read models XML file
     models = gammalib.GModels(xml_file)
@@ -908,14 +1125,7 @@ def show_model_spectrum(xml_file, plotfile,
         model = models[imod]
         if model.type() == 'DiffuseSource' or model.type() == 'PointSource':
             spectrum = model.spectral()
-            # Setup lists of x and y values
-            x   = []
-            y   = []
-            for i in range(enumbins):
-                energy = ebounds.elogmean(i)
-                value  = spectrum.eval(energy)
-                x.append(energy.TeV())
-                y.append(value)
+            y = _eval_spectrum(spectrum, energies, x_MeV)
             plt.loglog(x, y, linewidth=3, color=colors[imod], label=model.name()+' ('+spectrum.type()+')')
 
     plt.xlabel('Energy (TeV)')
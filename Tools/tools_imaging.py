@@ -7,9 +7,251 @@ to imaging.
 # Imports
 #==================================================
 
+import os
+import functools
+import threading
+import multiprocessing
+from collections import namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass
 import ctools
 import cscripts
+import gammalib
 import numpy as np
+from astropy.io import fits
+
+
+#==================================================
+# Shared configuration blocks
+#==================================================
+
+@dataclass(frozen=True)
+class MapGeometry:
+    """
+    Geometry of a square map in celestial coordinates, 
+    TAN projection.
+
+    Attributes
+    ----------
+    - npix (int): number of map pixel
+    - reso (float): map resolution in degrees
+    - cra, cdec (float): map center RA,Dec in degrees
+    """
+    
+    npix: int
+    reso: float
+    cra: float
+    cdec: float
+
+    def pars(self):
+        """ Return the corresponding ctools parameters """
+        return {'nxpix':    self.npix,
+                'nypix':    self.npix,
+                'binsz':    self.reso,
+                'coordsys': 'CEL',
+                'proj':     'TAN',
+                'xref':     self.cra,
+                'yref':     self.cdec}
+
+
+@dataclass(frozen=True)
+class IRFConfig:
+    """
+    Instrument response used by the analysis, either the binned 
+    cubes or the calibration database and response function.
+    It is hashable and keys the application cache.
+
+    Attributes
+    ----------
+    - expcube (string): exposure map cube
+    - psfcube (string): psfcube 
+    - bkgcube (string): background cube
+    - edispcube (string): energy dispersion cube
+    - caldb (string): calibration database
+    - irf (string): instrument response function
+    - edisp (bool): apply energy dispersion
+    """
+    
+    expcube: str = None
+    psfcube: str = None
+    bkgcube: str = None
+    edispcube: str = None
+    caldb: str = None
+    irf: str = None
+    edisp: bool = False
+
+    def pars(self):
+        """ Return the corresponding ctools parameters """
+        return {'expcube':   self.expcube,
+                'psfcube':   self.psfcube,
+                'bkgcube':   self.bkgcube,
+                'edispcube': self.edispcube,
+                'caldb':     self.caldb,
+                'irf':       self.irf,
+                'edisp':     self.edisp}
+
+
+#==================================================
+# Light weight results
+#==================================================
+
+SrcDetectResult = namedtuple('SrcDetectResult', 'outmodel outds9file threshold maxsrcs')
+TsmapResult     = namedtuple('TsmapResult', 'outmap srcname nxpix nypix binsz xref yref')
+ResmapResult    = namedtuple('ResmapResult', 'outmap algorithm nxpix nypix binsz xref yref')
+
+
+#==================================================
+# Parameter setting
+#==================================================
+
+def _apply_pars(app, pardict):
+    """
+    Set the parameters of a ctools application from a dictionary.
+    None values are ignored.
+
+    Parameters
+    ----------
+    - app (ctools application): the application to set
+    - pardict (dict): parameter name and value
+    """
+
+    for key, value in pardict.items():
+        if value is None:
+            continue
+        app[key] = value
+
+
+@contextmanager
+def _ctools_log(app, path):
+    """
+    Open the log file of a ctools application for the duration 
+    of the block, so that several executions can share a single 
+    open/close.
+
+    Parameters
+    ----------
+    - app (ctools application): the application
+    - path (str): the log file, nothing is done if None
+    """
+
+    if path is None:
+        yield
+        return
+
+    _apply_pars(app, {'logfile': path})
+    app.logFileOpen()
+    try:
+        yield
+    finally:
+        app.logFileClose()
+
+
+#==================================================
+# Cache of ctools applications
+#==================================================
+
+def _file_stamp(*paths):
+    """
+    Modification time and size of the given files, used to key the 
+    application cache on the state of the files rather than their 
+    names. Missing files (or None) give None.
+    """
+
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except (OSError, TypeError):
+            stamp.append(None)
+
+    return tuple(stamp)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_app(builder, args, stamp):
+    """
+    Return the application built by builder(*args), reused as long 
+    as the input files, described by stamp, do not change.
+    """
+
+    return builder(*args)
+
+
+def _get_app(builder, args, files, cache=True):
+    """
+    Return an application from the cache, or a new one owned by the 
+    caller if cache is False. The cached applications never leave 
+    this module, since the caller could modify them.
+
+    Parameters
+    ----------
+    - builder (function): build the application from args
+    - args (tuple): the arguments of builder
+    - files (list): the input files read by the application
+    - cache (bool): use the cache
+
+    Outputs
+    --------
+    - the application and its lock
+    """
+
+    if not cache:
+        return builder(*args)
+
+    return _cached_app(builder, args, _file_stamp(*files))
+
+
+def _new_srcdetect_app(inskymap):
+    """
+    Return a cssrcdetect application for the given map. A lock is 
+    attached to guard its execution.
+    """
+
+    srcdet  = cscripts.cssrcdetect()
+    _apply_pars(srcdet, {'inmap': inskymap})
+
+    return srcdet, threading.Lock()
+
+
+def _new_tsmap_app(inobs, inmodel, irf_cfg):
+    """
+    Return a cttsmap application with the input data and response 
+    already set. A lock is attached to guard its execution.
+    """
+
+    ts_map  = ctools.cttsmap()
+    _apply_pars(ts_map, {'inobs':   inobs,
+                         'inmodel': inmodel})
+    _apply_pars(ts_map, irf_cfg.pars())
+
+    return ts_map, threading.Lock()
+
+
+def _new_resmap_app(inobs, inmodel, modcube, irf_cfg):
+    """
+    Return a csresmap application with the input data and response 
+    already set. A lock is attached to guard its execution.
+    """
+
+    rmap    = cscripts.csresmap()
+    _apply_pars(rmap, {'inobs':   inobs,
+                       'inmodel': inmodel,
+                       'modcube': modcube})
+    _apply_pars(rmap, irf_cfg.pars())
+
+    return rmap, threading.Lock()
+
+
+def cluster_app_cache_clear():
+    """
+    Drop the cached cssrcdetect, cttsmap and csresmap applications, 
+    e.g. when files referenced by the input files (such as the event 
+    files of an observation definition) changed on disk.
+    """
+
+    _cached_app.cache_clear()
+
 
 #==================================================
 # Sky maps
@@ -84,11 +326,9 @@ def skymap(inobs, outmap,
     smap['threshold']   = threshold
     smap['inexclusion'] = 'NONE'
     smap['usefft']      = True
-    if logfile is not None: smap['logfile'] = logfile
 
-    if logfile is not None: smap.logFileOpen()
-    smap.execute()
-    if logfile is not None: smap.logFileClose()
+    with _ctools_log(smap, logfile):
+        smap.execute()
 
     if not silent:
         print(smap)
@@ -108,7 +348,8 @@ def src_detect(inskymap, outmodel, outds9file,
                corr_rad=0.2,
                exclrad=0.2,
                logfile=None,
-               silent=False):
+               silent=False,
+               return_summary=False):
     """
     Detect sources from a map
     See http://cta.irap.omp.eu/ctools/users/reference_manual/cssrcdetect.html
@@ -125,39 +366,44 @@ def src_detect(inskymap, outmodel, outds9file,
     - exclrad (float): Radius around a detected source that is excluded 
     from further source detection (degrees).
     - silent (bool): print information or not
+    - return_summary (bool): return a SrcDetectResult namedtuple 
+    instead of the cssrcdetect object. Only in this case a cached 
+    application is used, as it is not returned
 
     Outputs
     --------
     - Write xml model file
     - Write a DS9 region file
+    - return the cssrcdetect object, or its summary
     """
     
-    srcdet = cscripts.cssrcdetect()    
-
+    srcdet, lock = _get_app(_new_srcdetect_app, (inskymap,), [inskymap],
+                            cache=return_summary)
     
-    srcdet['inmap']      = inskymap
-    srcdet['outmodel']   = outmodel
-    srcdet['outds9file'] = outds9file
-    srcdet['srcmodel']   = 'POINT'   # For the moment, only point source + power law
-    srcdet['bkgmodel']   = 'NONE'    # NONE|IRF|AEFF|CUBE|RACC
-    srcdet['threshold']  = threshold
-    srcdet['maxsrcs']    = maxsrcs
-    srcdet['avgrad']     = avgrad
-    srcdet['corr_rad']   = corr_rad
-    srcdet['corr_kern']  = 'GAUSSIAN' #<NONE|DISK|GAUSSIAN>
-    srcdet['exclrad']    = exclrad
-    srcdet['fit_pos']    = True
-    srcdet['fit_shape']  = True
-    if logfile is not None: srcdet['logfile'] = logfile
-
-    if logfile is not None: srcdet.logFileOpen()
-    srcdet.execute()
-    if logfile is not None: srcdet.logFileClose()
+    with lock: # The cached application may be shared
+        _apply_pars(srcdet, {'outmodel':   outmodel,
+                             'outds9file': outds9file,
+                             'srcmodel':   'POINT',    # For the moment, only point source + power law
+                             'bkgmodel':   'NONE',     # NONE|IRF|AEFF|CUBE|RACC
+                             'threshold':  threshold,
+                             'maxsrcs':    maxsrcs,
+                             'avgrad':     avgrad,
+                             'corr_rad':   corr_rad,
+                             'corr_kern':  'GAUSSIAN', # NONE|DISK|GAUSSIAN
+                             'exclrad':    exclrad,
+                             'fit_pos':    True,
+                             'fit_shape':  True})
+
+        with _ctools_log(srcdet, logfile):
+            srcdet.execute()
     
-    if not silent:
-        print(srcdet)
-        print('')
+        if not silent:
+            print(srcdet)
+            print('')
 
+    if return_summary:
+        return SrcDetectResult(outmodel, outds9file, threshold, maxsrcs)
+    
     return srcdet
 
 
@@ -165,20 +411,14 @@ def src_detect(inskymap, outmodel, outds9file,
 # TS map
 #==================================================
 
-def tsmap(inobs, inmodel, outmap, srcname,
-          npix, reso, cra, cdec,
-          expcube=None, 
-          psfcube=None,
-          bkgcube=None,
-          edispcube=None,
-          caldb=None,
-          irf=None,
-          edisp=False,
+def tsmap(inobs, inmodel, outmap, srcname, geom,
+          irf_cfg=IRFConfig(),
           statistic='DEFAULT',
           like_accuracy=0.005,
           max_iter=50,
           logfile=None,
-          silent=False):
+          silent=False,
+          return_summary=False):
     """
     Compute TS map.
     http://cta.irap.omp.eu/ctools/users/reference_manual/cttsmap.html
@@ -189,63 +429,55 @@ def tsmap(inobs, inmodel, outmap, srcname,
     - inmodel (string): input model
     - outmap (string): output map file
     - srcname (string): name of the source to consider
-    - npix (int): number of map pixel
-    - reso (float): map resolution in degrees
-    - cra, cdec (float): map center RA,Dec in degrees
-    - expcube (string): exposure map cube
-    - psfcube (string): psfcube 
-    - bkgcube (string): background cube
-    - edispcube (string): energy dispersion cube
-    - caldb (string): calibration database
-    - irf (string): instrument response function
-    - edisp (bool): apply energy dispersion
+    - geom (MapGeometry): the map geometry
+    - irf_cfg (IRFConfig): the instrument response
     - statistic (string): which statistic to use
     - like_accuracy (float): likelihood accuracy
     - max_iter (int): maximum number of iteration
     - silent (bool): print information or not
+    - return_summary (bool): return a TsmapResult namedtuple 
+    instead of the cttsmap object. Only in this case a cached 
+    application is used, as it is not returned
     Outputs
     --------
     - create TS map fits
-    - return a TS map object
+    - return a TS map object, or its summary
     """
 
-    ts_map = ctools.cttsmap()
+    ts_map, lock = _get_app(_new_tsmap_app, (inobs, inmodel, irf_cfg),
+                            [inobs, inmodel, irf_cfg.expcube, irf_cfg.psfcube,
+                             irf_cfg.bkgcube, irf_cfg.edispcube],
+                            cache=return_summary)
     
-    ts_map['inobs']         = inobs
-    ts_map['inmodel']       = inmodel
-    ts_map['srcname']       = srcname
-    if expcube   is not None: ts_map['expcube']   = expcube
-    if psfcube   is not None: ts_map['psfcube']   = psfcube
-    if edispcube is not None: ts_map['edispcube'] = edispcube
-    if bkgcube   is not None: ts_map['bkgcube']   = bkgcube
-    if caldb     is not None: ts_map['caldb']     = caldb
-    if irf       is not None: ts_map['irf']       = irf
-    ts_map['edisp']         = edisp
-    ts_map['outmap']        = outmap
-    ts_map['errors']        = False
-    ts_map['statistic']     = statistic
-    ts_map['like_accuracy'] = like_accuracy
-    ts_map['max_iter']      = max_iter
-    ts_map['usepnt']        = False
-    ts_map['nxpix']         = npix
-    ts_map['nypix']         = npix
-    ts_map['binsz']         = reso
-    ts_map['coordsys']      = 'CEL'
-    ts_map['proj']          = 'TAN'
-    ts_map['xref']          = cra
-    ts_map['yref']          = cdec
-    #ts_map['binmin']        = -1
-    #ts_map['binmax']        = -1
-    #ts_map['logL0']         = -1.0
-    if logfile is not None: ts_map['logfile'] = logfile
-
-    if logfile is not None: ts_map.logFileOpen()
-    ts_map.execute()
-    if logfile is not None: ts_map.logFileClose()
+    with lock: # The cached application may be shared
+        _apply_pars(ts_map, geom.pars())
+        _apply_pars(ts_map, {'srcname':       srcname,
+                             'outmap':        outmap,
+                             'errors':        False,
+                             'statistic':     statistic,
+                             'like_accuracy': like_accuracy,
+                             'max_iter':      max_iter,
+                             'usepnt':        False,
+                             #'binmin':        -1,
+                             #'binmax':        -1,
+                             #'logL0':         -1.0,
+                             })
+
+        # The fits of a previous run are kept in the loaded models, start again from inmodel
+        if ts_map.obs().size() > 0:
+            obs = ts_map.obs().copy()
+            obs.models(gammalib.GModels(inmodel))
+            ts_map.obs(obs)
+
+        with _ctools_log(ts_map, logfile):
+            ts_map.execute()
     
-    if not silent:
-        print(ts_map)
-        print('')
+        if not silent:
+            print(ts_map)
+            print('')
+
+    if return_summary:
+        return TsmapResult(outmap, srcname, geom.npix, geom.npix, geom.reso, geom.cra, geom.cdec)
         
     return ts_map
 
@@ -254,20 +486,14 @@ def tsmap(inobs, inmodel, outmap, srcname,
 # Residual maps
 #==================================================
 
-def resmap(inobs, inmodel, output_map,
-           npix, reso, cra, cdec,
+def resmap(inobs, inmodel, output_map, geom,
            emin=1e-2, emax=1e+3, enumbins=20, ebinalg='LOG',
            modcube=None, 
-           expcube=None, 
-           psfcube=None,
-           bkgcube=None,
-           edispcube=None,
-           caldb=None,
-           irf=None,
-           edisp=False,
+           irf_cfg=IRFConfig(),
            algo='SIGNIFICANCE',
            logfile=None,
-           silent=False):
+           silent=False,
+           return_summary=False):
     """
     Compute a residual map.
     
@@ -276,64 +502,156 @@ def resmap(inobs, inmodel, output_map,
     - inobs (string): input observation file
     - inmodel (string): input model
     - output_map (string): output map file
-    - npix (int): number of map pixel
-    - reso (float): map resolution in degrees
-    - cra, cdec (float): map center RA,Dec in degrees
+    - geom (MapGeometry): the map geometry
     - emin,emax (float) min and max energy considered in TeV
     - enumbins (int): number of energy bins
     - ebinalg (string): energy bining algorithm
     - modcube (string): model map cube
-    - expcube (string): exposure map cube
-    - psfcube (string): psfcube 
-    - bkgcube (string): background cube
-    - edispcube (string): energy dispersion cube
-    - caldb (string): calibration database
-    - irf (string): instrument response function
-    - edisp (bool): apply energy dispersion
+    - irf_cfg (IRFConfig): the instrument response
     - algo (string): wich algorithm to use
     - silent (bool): print information or not
+    - return_summary (bool): return a ResmapResult namedtuple 
+    instead of the csresmap object. Only in this case a cached 
+    application is used, as it is not returned
 
     Outputs
     --------
     - create residual map fits
-    - return a residual map object
+    - return a residual map object, or its summary
     """
 
-    rmap = cscripts.csresmap()
+    rmap, lock = _get_app(_new_resmap_app, (inobs, inmodel, modcube, irf_cfg),
+                          [inobs, inmodel, modcube, irf_cfg.expcube, irf_cfg.psfcube,
+                           irf_cfg.bkgcube, irf_cfg.edispcube],
+                          cache=return_summary)
     
-    rmap['inobs']     = inobs
-    rmap['inmodel']   = inmodel
-    if modcube   is not None: rmap['modcube']   = modcube
-    if expcube   is not None: rmap['expcube']   = expcube
-    if psfcube   is not None: rmap['psfcube']   = psfcube
-    if edispcube is not None: rmap['edispcube'] = edispcube
-    if bkgcube   is not None: rmap['bkgcube']   = bkgcube
-    if caldb     is not None: rmap['caldb']     = caldb
-    if irf       is not None: rmap['irf']       = irf
-    rmap['edisp']     = edisp
-    rmap['outmap']    = output_map
-    rmap['ebinalg']   = ebinalg
-    rmap['emin']      = emin   
-    rmap['emax']      = emax
-    rmap['enumbins']  = enumbins
-    rmap['ebinfile']  = 'NONE'
-    rmap['coordsys']  = 'CEL'
-    rmap['proj']      = 'TAN'
-    rmap['xref']      = cra
-    rmap['yref']      = cdec
-    rmap['nxpix']     = npix
-    rmap['nypix']     = npix
-    rmap['binsz']     = reso
-    rmap['algorithm'] = algo
-    if logfile is not None: rmap['logfile'] = logfile
-
-    if logfile is not None: rmap.logFileOpen()
-    rmap.execute()
-    if logfile is not None: rmap.logFileClose()
+    with lock: # The cached application may be shared
+        _apply_pars(rmap, geom.pars())
+        _apply_pars(rmap, {'outmap':    output_map,
+                           'ebinalg':   ebinalg,
+                           'emin':      emin,
+                           'emax':      emax,
+                           'enumbins':  enumbins,
+                           'ebinfile':  'NONE',
+                           'algorithm': algo})
+
+        with _ctools_log(rmap, logfile):
+            rmap.execute()
     
-    if not silent:
-        print(rmap)
-        print('')
+        if not silent:
+            print(rmap)
+            print('')
+
+    if return_summary:
+        return ResmapResult(output_map, algo, geom.npix, geom.npix, geom.reso, geom.cra, geom.cdec)
     
     return rmap
 
+
+#==================================================
+# Parallel sweeps
+#==================================================
+
+def _tsmap_worker(kwargs):
+    """
+    Run tsmap in a worker process and return the output map name,
+    since ctools applications cannot be sent back to the parent.
+    """
+    
+    tsmap(**dict(kwargs, return_summary=True))
+
+    return kwargs['outmap']
+
+
+def _resmap_worker(kwargs):
+    """
+    Run resmap in a worker process and return the output map name,
+    since ctools applications cannot be sent back to the parent.
+    """
+    
+    resmap(**dict(kwargs, return_summary=True))
+
+    return kwargs['output_map']
+
+
+def tsmap_batch(configs, nproc=None):
+    """
+    Compute several TS maps in parallel, e.g. for a sweep over 
+    sources or map centers.
+
+    Parameters
+    ----------
+    - configs (dict list): keyword arguments of each tsmap call
+    - nproc (int): number of processes, all cores by default
+
+    Outputs
+    --------
+    - create the TS map fits files
+    - return the list of output map files
+    """
+
+    with multiprocessing.get_context('fork').Pool(nproc) as pool:
+        outmaps = pool.map(_tsmap_worker, configs)
+
+    return outmaps
+
+
+def resmap_batch(configs, nproc=None):
+    """
+    Compute several residual maps in parallel, e.g. for a sweep 
+    over algorithms or map centers.
+
+    Parameters
+    ----------
+    - configs (dict list): keyword arguments of each resmap call
+    - nproc (int): number of processes, all cores by default
+
+    Outputs
+    --------
+    - create the residual map fits files
+    - return the list of output map files
+    """
+
+    with multiprocessing.get_context('fork').Pool(nproc) as pool:
+        outmaps = pool.map(_resmap_worker, configs)
+
+    return outmaps
+
+
+#==================================================
+# Check of the application cache
+#==================================================
+
+def tsmap_cache_check(kwargs, previous=None, rtol=1e-5, atol=1e-8):
+    """
+    Check that a TS map computed with a reused (cached) cttsmap 
+    application is the same as the one from a fresh application.
+    The cached application is first used for the previous call 
+    (e.g. another source) or for the same call, so that the checked 
+    run starts from an application that already ran.
+
+    Parameters
+    ----------
+    - kwargs (dict): keyword arguments of the tsmap call to check
+    - previous (dict): keyword arguments of a tsmap call run before
+    - rtol, atol (float): tolerances of the comparison
+
+    Outputs
+    --------
+    - create the TS map fits file, and the fresh one with the 
+    _fresh suffix
+    - return True if the maps agree
+    """
+
+    outfresh = kwargs['outmap'].replace('.fits', '_fresh.fits')
+
+    if previous is None:
+        previous = kwargs
+    tsmap(**dict(previous, return_summary=True))
+    tsmap(**dict(kwargs, return_summary=True))
+    tsmap(**dict(kwargs, outmap=outfresh, return_summary=False))
+
+    ts_cached = fits.getdata(kwargs['outmap'], 0)
+    ts_fresh  = fits.getdata(outfresh, 0)
+
+    return np.allclose(ts_cached, ts_fresh, rtol=rtol, atol=atol, equal_nan=True)
@@ -37,6 +37,8 @@ class ClusterPipe(Common, CTAsim, CTAana):
     ----------  
     - silent (bool): print information if False, or not otherwise.
     - output_dir (str): directory where to output data files and plots.
+    - heavy_array_sidecar (bool): save large arrays as .npy files next to 
+    the pickled configuration, memory mapped (copy-on-write) when loaded.
     - cluster (ClusterModel object): the cluster object which gather the
     physical properties of clusters
     - compact_source (CompactSource object): object from the class CompactSource
@@ -82,6 +84,7 @@ class ClusterPipe(Common, CTAsim, CTAana):
         self.silent     = silent
         self.output_dir = output_dir
         cluster.output_dir = output_dir
+        self.heavy_array_sidecar = False
         
         #---------- Sky model
         self.cluster        = cluster
@@ -416,6 +416,9 @@ class CTAana(object):
         
         #========== Defines cubes
         inobs, inmodel, expcube, psfcube, bkgcube, edispcube, modcube, modcubeCl = self._define_std_filenames()
+
+        #========== Input files may have been rewritten since the last run
+        tools_imaging.cluster_app_cache_clear()
         
         #========== Compute skymap
         if do_Skymap:
@@ -442,50 +445,48 @@ class CTAana(object):
                                                   threshold=4.0, maxsrcs=10, avgrad=1.0,
                                                   corr_rad=0.05, exclrad=0.2,
                                                   logfile=self.output_dir+'/Ana_Sourcedetect_log.txt',
-                                                  silent=self.silent)
+                                                  silent=self.silent, return_summary=True)
             else:
                 print(self.output_dir+'/Ana_SkymapTot.fits what not created and is needed for source detection.')
                 print('')
                 
         #========== Compute residual (w/wo cluster subtracted)
         if do_Res:
+            geom    = tools_imaging.MapGeometry(npix, self.map_reso.to_value('deg'),
+                                                self.map_coord.icrs.ra.to_value('deg'),
+                                                self.map_coord.icrs.dec.to_value('deg'))
+            irf_cfg = tools_imaging.IRFConfig(expcube=expcube, psfcube=psfcube,
+                                              bkgcube=bkgcube, edispcube=edispcube,
+                                              caldb=None, irf=None,
+                                              edisp=self.spec_edisp)
+            
             #----- Total residual and keeping the cluster
             for alg in ['SIGNIFICANCE', 'SUB', 'SUBDIV']:
                 resmap = tools_imaging.resmap(self.output_dir+'/Ana_Countscube.fits',
                                               self.output_dir+'/Ana_Model_Output.xml',
                                               self.output_dir+'/Ana_ResmapTot_'+alg+'.fits',
-                                              npix, self.map_reso.to_value('deg'),
-                                              self.map_coord.icrs.ra.to_value('deg'),
-                                              self.map_coord.icrs.dec.to_value('deg'),
+                                              geom,
                                               emin=self.spec_emin.to_value('TeV'),
                                               emax=self.spec_emax.to_value('TeV'),
                                               enumbins=self.spec_enumbins, ebinalg=self.spec_ebinalg,
                                               modcube=modcube,
-                                              expcube=expcube, psfcube=psfcube,
-                                              bkgcube=bkgcube, edispcube=edispcube,
-                                              caldb=None, irf=None,
-                                              edisp=self.spec_edisp,
+                                              irf_cfg=irf_cfg,
                                               algo=alg,
                                               logfile=self.output_dir+'/Ana_ResmapTot_'+alg+'_log.txt',
-                                              silent=self.silent)
+                                              silent=self.silent, return_summary=True)
 
                 resmap = tools_imaging.resmap(self.output_dir+'/Ana_Countscube.fits',
                                               self.output_dir+'/Ana_Model_Output_Cluster.xml',
                                               self.output_dir+'/Ana_ResmapCluster_'+alg+'.fits',
-                                              npix, self.map_reso.to_value('deg'),
-                                              self.map_coord.icrs.ra.to_value('deg'),
-                                              self.map_coord.icrs.dec.to_value('deg'),
+                                              geom,
                                               emin=self.spec_emin.to_value('TeV'),
                                               emax=self.spec_emax.to_value('TeV'),
                                               enumbins=self.spec_enumbins, ebinalg=self.spec_ebinalg,
                                               modcube=modcubeCl,
-                                              expcube=expcube, psfcube=psfcube,
-                                              bkgcube=bkgcube, edispcube=edispcube,
-                                              caldb=None, irf=None,
-                                              edisp=self.spec_edisp,
+                                              irf_cfg=irf_cfg,
                                               algo=alg,
                                               logfile=self.output_dir+'/Ana_ResmapCluster_'+alg+'_log.txt',
-                                              silent=self.silent)
+                                              silent=self.silent, return_summary=True)
 
             #----- Cluster profile
             hdul       = fits.open(self.output_dir+'/Ana_ResmapCluster_SUB.fits')
@@ -525,13 +526,13 @@ class CTAana(object):
                 wsrc = np.where(np.array(self.compact_source.name) == src)[0][0]
                 ctr_ra  = self.compact_source.spatial[wsrc]['param']['RA']['value'].to_value('deg')
                 ctr_dec = self.compact_source.spatial[wsrc]['param']['DEC']['value'].to_value('deg')
+                geom_ts = tools_imaging.MapGeometry(npix_ts, reso_ts.to_value('deg'), ctr_ra, ctr_dec)
                 tsmap = tools_imaging.tsmap(inobs, inmodel, self.output_dir+'/Ana_TSmap_'+src+'.fits',
-                                            src, npix_ts, reso_ts.to_value('deg'), ctr_ra, ctr_dec,
-                                            expcube=None, psfcube=None, bkgcube=None, edispcube=None,
-                                            caldb=None, irf=None, edisp=self.spec_edisp,
+                                            src, geom_ts,
+                                            irf_cfg=tools_imaging.IRFConfig(edisp=self.spec_edisp),
                                             statistic=self.method_stat,
                                             logfile=self.output_dir+'/Ana_TSmap_'+src+'_log.txt',
-                                            silent=self.silent)
+                                            silent=self.silent, return_summary=True)
                 
                 
     #==================================================
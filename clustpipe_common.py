@@ -11,6 +11,9 @@ related to the ClusterPipe.
 import os
 import numpy as np
 import pickle
+import gzip
+import glob
+import uuid
 import gammalib
 import astropy.units as u
 from astropy.coordinates.sky_coordinate import SkyCoord
@@ -19,6 +22,192 @@ from ClusterPipe.Tools import make_cluster_template
 from ClusterPipe.Tools import build_ctools_model
 from ClusterPipe.Tools import utilities
 
+#==================================================
+# HDF5 configuration I/O
+#==================================================
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+GZIP_SIGNATURE = b'\x1f\x8b'
+
+def _h5_write_dict(grp, dictionary):
+    """
+    Write a dictionary in a HDF5 group: numerical arrays as 
+    compressed datasets, scalars and strings as attributes, 
+    dictionaries as sub-groups, and anything else as pickled bytes.
+    
+    Parameters
+    ----------
+    - grp (h5py Group): the group to fill
+    - dictionary (dict): the data to write
+
+    """
+
+    for key, value in dictionary.items():
+        if type(value) in (np.ndarray, np.memmap) and value.dtype.kind in 'biuf' and value.ndim > 0:
+            grp.create_dataset(key, data=value, chunks=True, compression='gzip', shuffle=True)
+        elif isinstance(value, (bool, int, float, str, np.number, np.bool_)):
+            grp.attrs[key] = value
+        elif type(value) == dict and all(isinstance(k, str) and '/' not in k for k in value):
+            _h5_write_dict(grp.create_group(key), value)
+        else:
+            dset = grp.create_dataset(key, data=np.void(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            dset.attrs['pickled'] = True
+
+
+def _h5_read_group(grp):
+    """
+    Read back a HDF5 group written by _h5_write_dict.
+    
+    Parameters
+    ----------
+    - grp (h5py Group): the group to read
+
+    Outputs
+    -------
+    - dictionary (dict): the data
+    
+    """
+
+    dictionary = {}
+    for key, value in grp.attrs.items():
+        dictionary[key] = value.item() if isinstance(value, np.generic) else value
+    for key, item in grp.items():
+        if hasattr(item, 'keys'):
+            dictionary[key] = _h5_read_group(item)
+        elif item.attrs.get('pickled', False):
+            dictionary[key] = pickle.loads(item[()].tobytes())
+        else:
+            dictionary[key] = item[...]
+            
+    return dictionary
+
+
+#==================================================
+# Pickle with large arrays as side files
+#==================================================
+
+SIDECAR_PATTERN = 'config_array_*.npy'
+
+class _SidecarPickler(pickle.Pickler):
+    """
+    Pickler that writes large numerical arrays to .npy files next to 
+    the configuration, and only pickles their name. Each save uses 
+    new files, so that the previous configuration stays valid until 
+    it is replaced. The written files are listed in self.files.
+    """
+
+    def __init__(self, file, outdir, threshold=8*2**20):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.outdir    = outdir
+        self.threshold = threshold
+        self.files     = []
+        self.saved     = {}
+
+    def persistent_id(self, obj):
+        # Subclasses such as Quantity would lose their attributes in .npy files
+        if type(obj) in (np.ndarray, np.memmap) and obj.dtype.kind != 'O' and obj.nbytes > self.threshold:
+            if id(obj) in self.saved: # Same array seen twice
+                return ('npy', self.saved[id(obj)])
+            name = SIDECAR_PATTERN.replace('*', uuid.uuid4().hex)
+            path = self.outdir+'/'+name
+            with open(path+'.tmp', 'wb') as afile:
+                np.save(afile, obj)
+            os.replace(path+'.tmp', path)
+            self.files.append(name)
+            self.saved[id(obj)] = name
+            return ('npy', name)
+        return None
+
+
+class _SidecarUnpickler(pickle.Unpickler):
+    """
+    Unpickler that reads back the arrays saved by _SidecarPickler, 
+    relative to the configuration directory. They are memory mapped 
+    copy-on-write, so they can be modified without changing the files.
+    """
+
+    def __init__(self, file, configdir):
+        super().__init__(file)
+        self.configdir = configdir
+        self.loaded    = {}
+
+    def persistent_load(self, pid):
+        if pid[0] == 'npy':
+            if pid[1] not in self.loaded: # Keep shared arrays shared
+                self.loaded[pid[1]] = np.load(self.configdir+'/'+pid[1], mmap_mode='c')
+            return self.loaded[pid[1]]
+        raise pickle.UnpicklingError('Unknown persistent id: '+str(pid))
+
+
+#==================================================
+# Configuration writing
+#==================================================
+
+PICKLE_ERRORS = (pickle.PicklingError, TypeError, AttributeError)
+
+def _split_picklable(dictionary):
+    """
+    Separate the entries of a dictionary that can be pickled from 
+    those that cannot (e.g. ctools applications, lambdas).
+    
+    Parameters
+    ----------
+    - dictionary (dict): the data to check
+
+    Outputs
+    -------
+    - picklable (dict): the entries that can be pickled
+    - skipped (list): the keys of the other entries
+    
+    """
+
+    picklable = {}
+    skipped   = []
+    for key, value in dictionary.items():
+        try:
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            picklable[key] = value
+        except PICKLE_ERRORS:
+            skipped.append(key)
+            
+    return picklable, skipped
+
+
+def _write_config(filename, config, hdf5=False, sidecar_dir=None):
+    """
+    Write the configuration dictionary in a file.
+    
+    Parameters
+    ----------
+    - filename (str): the file to write
+    - config (dict): the configuration
+    - hdf5 (bool): write as HDF5 instead of gzipped pickle
+    - sidecar_dir (str): if given, large arrays are saved as .npy 
+    files in this directory (pickle case only)
+
+    Outputs
+    -------
+    - files (list): the .npy files written
+
+    """
+
+    if hdf5:
+        import h5py
+        with h5py.File(filename, 'w') as hfile:
+            _h5_write_dict(hfile, config)
+    else:
+        with open(filename, 'wb', buffering=1<<20) as rawfile:
+            with gzip.GzipFile(fileobj=rawfile, mode='wb', compresslevel=1) as pfile:
+                if sidecar_dir is not None:
+                    pickler = _SidecarPickler(pfile, sidecar_dir)
+                    pickler.dump(config)
+                    return pickler.files
+                else:
+                    pickle.dump(config, pfile, pickle.HIGHEST_PROTOCOL)
+
+    return []
+
+
 #==================================================
 # Cluster class
 #==================================================
@@ -31,8 +220,8 @@ class Common():
     
     Methods
     ----------  
-    - config_save(self, config_file)
-    - config_load(self)
+    - config_save(self, hdf5=False)
+    - config_load(self, config_file)
     - _check_obsID(self, obsID)
     - _correct_eventfile_names(self, xmlfile, prefix='Events')
     - _write_new_xmlevent_from_obsid(self, xmlin, xmlout, obsID)
@@ -47,12 +236,20 @@ class Common():
     # Save the simulation configuration
     #==================================================
     
-    def config_save(self):
+    def config_save(self, hdf5=False):
         """
         Save the configuration for latter use
         
         Parameters
         ----------
+        - hdf5 (bool): save as config.h5 (requires h5py), with numerical 
+        arrays stored as compressed datasets, instead of the gzipped 
+        pickle config.pkl
+        If self.heavy_array_sidecar is True, arrays larger than 8 MiB are 
+        saved in config_array_*.npy files in the pickle case, and memory 
+        mapped (copy-on-write) at loading
+        Attributes that cannot be pickled are skipped, and their names 
+        are listed in config.skipped.txt
 
         Outputs
         -------
@@ -60,11 +257,44 @@ class Common():
         """
         
         # Create the output directory if needed
-        if not os.path.exists(self.output_dir): os.mkdir(self.output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
 
-        # Save
-        with open(self.output_dir+'/config.pkl', 'wb') as pfile:
-            pickle.dump(self.__dict__, pfile, pickle.HIGHEST_PROTOCOL)
+        if hdf5:
+            final = self.output_dir+'/config.h5'
+        else:
+            final = self.output_dir+'/config.pkl' # Same name as before, config_load detects gzip
+        tmp      = final+'.tmp'
+        sidecar  = self.output_dir if getattr(self, 'heavy_array_sidecar', False) else None
+        skipfile = self.output_dir+'/config.skipped.txt'
+        
+        # Save in a temporary file, moved in place once complete.
+        # Attributes are only checked one by one if the direct save fails
+        try:
+            files   = _write_config(tmp, self.__dict__, hdf5=hdf5, sidecar_dir=sidecar)
+            skipped = []
+        except PICKLE_ERRORS:
+            config, skipped = _split_picklable(self.__dict__)
+            for key in skipped:
+                if not self.silent: print('WARNING: '+key+' cannot be pickled, it is not saved in the configuration')
+            files = _write_config(tmp, config, hdf5=hdf5, sidecar_dir=sidecar)
+        os.replace(tmp, final)
+
+        # Remove the array files of previous saves (still readable 
+        # through existing memory maps on POSIX systems)
+        if not hdf5:
+            for path in glob.glob(self.output_dir+'/'+SIDECAR_PATTERN):
+                if os.path.basename(path) not in files:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+        # Keep track of what was not saved
+        if len(skipped) > 0:
+            with open(skipfile, 'w') as sfile:
+                sfile.write('\n'.join(skipped)+'\n')
+        elif os.path.exists(skipfile):
+            os.remove(skipfile)
             
             
     #==================================================
@@ -77,7 +307,8 @@ class Common():
         
         Parameters
         ----------
-        - config_file (str): the full name to the configuration file
+        - config_file (str): the full name to the configuration file, 
+        either pickle (plain or gzipped) or HDF5
 
         Outputs
         -------
@@ -85,7 +316,18 @@ class Common():
         """
 
         with open(config_file, 'rb') as pfile:
-            par = pickle.load(pfile)
+            signature = pfile.read(len(HDF5_SIGNATURE))
+
+        if signature == HDF5_SIGNATURE:
+            import h5py
+            with h5py.File(config_file, 'r') as hfile:
+                par = _h5_read_group(hfile)
+        elif signature[0:len(GZIP_SIGNATURE)] == GZIP_SIGNATURE:
+            with gzip.open(config_file, 'rb') as pfile:
+                par = _SidecarUnpickler(pfile, os.path.dirname(os.path.abspath(config_file))).load()
+        else:
+            with open(config_file, 'rb') as pfile:
+                par = _SidecarUnpickler(pfile, os.path.dirname(os.path.abspath(config_file))).load()
             
         self.__dict__ = par
 
@@ -108,42 +350,43 @@ class Common():
         
         """
         
-        if obsID is None:
-            obsID = self.obs_setup.obsid
+        # Default case, nothing to check
+        if obsID is None or obsID is self.obs_setup.obsid:
+            obsID = list(self.obs_setup.obsid)
             
         else:        
             # Case of obsID as a string, i.e. single run
-            if type(obsID) == str:
-                if obsID in self.obs_setup.obsid:
+            if isinstance(obsID, str):
+                if obsID in self.obs_setup._obsid_set:
                     obsID = [obsID] # all good, just make it as a list
                 else:
                     raise ValueError("The given obsID does not match any of the available observation ID.")
                 
-            # Case of obsID as a list, i.e. multiple run
-            elif type(obsID) == list:
-                good = np.array(obsID) == np.array(obsID) # create an array of True
-                for i in range(len(obsID)):
-                    # Check type
-                    if type(obsID[i]) != str:
-                        raise ValueError("The given obsID should be a string or a list of string.")
-                
-                    # Check if the obsID is valid and flag
-                    if obsID[i] not in self.obs_setup.obsid:
-                        if not self.silent: print('WARNING: obsID '+obsID[i]+' does not exist, ignore it')
-                        good[i] = False
+            # Case of obsID as a list or tuple, i.e. multiple run
+            elif isinstance(obsID, (list, tuple)):
+                # Check type
+                if not all(isinstance(obsid_i, str) for obsid_i in obsID):
+                    raise ValueError("The given obsID should be a string or a list of string.")
+
+                valid_ids = self.obs_setup._obsid_set
+                checked   = []
+                for obsid_i in dict.fromkeys(obsID): # Remove duplicate, keeping the order
+                    # Check if the obsID is valid
+                    if obsid_i not in valid_ids:
+                        if not self.silent: print('WARNING: obsID '+obsid_i+' does not exist, ignore it')
+                        continue
+
+                    checked.append(obsid_i)
 
                 # Select valid obsID
-                if np.sum(good) == 0:
+                if len(checked) == 0:
                     raise ValueError("None of the given obsID exist")
                 else:
-                    obsID = list(np.array(obsID)[good])
-                    
-                # Remove duplicate
-                obsID = list(set(obsID))
+                    obsID = checked
                     
                 # Case of from format
             else:
-                raise ValueError("The obsID should be either a list or a string.")
+                raise ValueError("The obsID should be either a list, a tuple or a string.")
     
         return obsID
 